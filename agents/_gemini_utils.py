@@ -0,0 +1,26 @@
+# agents/_gemini_utils.py
+"""Shared helpers for google-genai responses."""
+
+
+def response_text(resp) -> str:
+    """Extract the reply text from a Gemini response.
+
+    The SDK's aggregated .text covers the happy path; responses where it is
+    unset fall back to the first candidate's parts.
+    """
+    try:
+        text = resp.text
+        if text:
+            return text
+    except (AttributeError, ValueError):
+        pass
+
+    try:
+        for part in resp.candidates[0].content.parts:
+            text = getattr(part, "text", None)
+            if text:
+                return text
+    except (AttributeError, IndexError, TypeError):
+        pass
+
+    return str(resp)
@@ -3,7 +3,10 @@ import os
 import re
 import uuid
 import time
+import asyncio
+import hashlib
 import logging
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional
 from datetime import datetime
@@ -11,6 +14,7 @@ import google.genai as genai
 from google.genai import types
 from tools.google_search import GoogleSearchTool
 from memory.memorybank import MemoryBank
+from agents._gemini_utils import response_text
 
 logger = logging.getLogger("edu_agent")
 logger.setLevel(logging.INFO)
@@ -18,6 +22,46 @@ logger.setLevel(logging.INFO)
 API_KEY = os.getenv("GOOGLE_API_KEY")
 USE_GEMINI = os.getenv("USE_GEMINI", "true").lower() in ("1", "true", "yes")
 
+# Exact-match LLM response cache: repeated prompts skip the Gemini round-trip
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))  # seconds
+
+# Quiz trigger keywords, compiled into a single alternation so detection is
+# one linear scan instead of one substring search per keyword
+_QUIZ_TRIGGER_RE = re.compile(
+    r'\b(?:take a test|take test|start a test|start test|'
+    r'quiz me|give me a quiz|test me|give me a test|'
+    r'mcq test|mcq on|multiple choice)\b'
+)
+
+# Pre-compiled patterns for quiz detection (avoids re-parsing on every chat turn)
+_TOPIC_RE = re.compile(
+    r'(?:on|about|for|in)\s+([a-zA-Z0-9\s]+?)(?:\s+(?:class|grade|for\s+class|for\s+grade))?'
+)
+_CLASS_RE = re.compile(r'class\s+(\d+)|grade\s+(\d+)')
+_NUM_RE = re.compile(r'(\d+)\s+questions?')
+
+# Invariant parts of the system prompt, built once instead of per turn
+_SYSTEM_PROMPT_HEAD = """
+You are **Study Genie**, an AI study assistant. Always reply in a clean structured format.
+
+### 📌 RULES FOR EVERY RESPONSE
+- If user greets → greet warmly + introduce yourself.
+- Use clean formatting:
+  - Headings (###)
+  - Bullet points
+  - Numbered steps
+  - Code blocks if needed
+  - Bold for key terms
+- Give clear explanations suitable for students.
+- Include examples whenever possible.
+- End with a **2-line summary**.
+- List **up to 3 helpful sources** at the end (if available).
+"""
+
+_SYSTEM_PROMPT_TAIL = """### 👉 NOW RESPOND FOLLOWING ALL RULES ABOVE
+"""
+
 if USE_GEMINI and API_KEY:
     try:
         genai.configure(api_key=API_KEY)
@@ -35,37 +79,32 @@ class AgentResponse:
 
 
 class EduAgent:
-    def __init__(self, memory_file: str = "memory_bank.json"):
+    def __init__(self, memory_file: str = "memory_bank.db"):
         self.search_tool = GoogleSearchTool()
         self.memory = MemoryBank(memory_file)
+        # Single client shared across turns; keeps the HTTP connection pool warm
+        self._genai_client = genai.Client() if (USE_GEMINI and API_KEY) else None
+        # prompt-hash -> (timestamp, response text), evicted LRU-first
+        self._llm_cache: OrderedDict = OrderedDict()
     
     # ---------------------------
     # Quiz Detection
     # ---------------------------
-    def detect_quiz_request(self, text: str) -> Optional[Dict[str, Any]]:
+    def detect_quiz_request(self, text: str, text_lower: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Detect if user wants to take a test/quiz"""
-        text_lower = text.lower()
-        
-        # Quiz trigger keywords
-        quiz_keywords = [
-            "take a test", "take test", "start a test", "start test",
-            "quiz me", "give me a quiz", "test me", "give me a test",
-            "mcq test", "mcq on", "multiple choice"
-        ]
-        
-        is_quiz = any(keyword in text_lower for keyword in quiz_keywords)
-        
+        if text_lower is None:
+            text_lower = text.lower()
+
+        is_quiz = _QUIZ_TRIGGER_RE.search(text_lower) is not None
+
         if not is_quiz:
             return None
-        
+
         # Extract topic using regex
-        topic_match = re.search(
-            r'(?:on|about|for|in)\s+([a-zA-Z0-9\s]+?)(?:\s+(?:class|grade|for\s+class|for\s+grade))?',
-            text_lower
-        )
-        
+        topic_match = _TOPIC_RE.search(text_lower)
+
         # Extract class level
-        class_match = re.search(r'class\s+(\d+)|grade\s+(\d+)', text_lower)
+        class_match = _CLASS_RE.search(text_lower)
         
         topic = "general programming"
         class_level = "11"
@@ -77,7 +116,7 @@ class EduAgent:
             class_level = class_match.group(1) or class_match.group(2)
         
         # Extract number of questions
-        num_match = re.search(r'(\d+)\s+questions?', text_lower)
+        num_match = _NUM_RE.search(text_lower)
         num_questions = int(num_match.group(1)) if num_match else 5
         num_questions = min(max(num_questions, 3), 10)  # Limit between 3-10
         
@@ -90,62 +129,54 @@ class EduAgent:
     # ---------------------------
     # Greeting / preprocessing
     # ---------------------------
-    def preprocess_user_input(self, text: str) -> str:
-        msg = text.strip().lower()
-        greetings = ["hi", "hello", "hey", "hii", "hola"]
+    def preprocess_user_input(self, text: str, text_lower: Optional[str] = None) -> str:
+        msg = text_lower if text_lower is not None else text.strip().lower()
+        greetings = ("hi", "hello", "hey", "hii", "hola")
         if msg in greetings:
             return "Greet the user politely, introduce yourself as Study Genie, and ask how you can help with studies."
         return text
     
     # ---------------------------
-    # Extract text from Gemini response
+    # LLM response cache
     # ---------------------------
-    def _extract_text_from_response(self, resp) -> str:
-        try:
-            if hasattr(resp, "text") and resp.text:
-                return resp.text
-        except:
-            pass
-        
-        try:
-            out = getattr(resp, "output", None)
-            if out:
-                for o in out:
-                    parts = getattr(o, "content", None) or o.get("content", [])
-                    for p in parts:
-                        txt = p.get("text") if isinstance(p, dict) else getattr(p, "text", None)
-                        if txt:
-                            return txt
-        except:
-            pass
-        
-        try:
-            cand = getattr(resp, "candidates", None)
-            if cand:
-                c0 = cand[0]
-                if hasattr(c0, "content"):
-                    parts = getattr(c0.content, "parts", [])
-                    for p in parts:
-                        txt = p.get("text") if isinstance(p, dict) else getattr(p, "text", None)
-                        if txt:
-                            return txt
-                if hasattr(c0, "text"):
-                    return c0.text
-        except:
-            pass
-        
-        return str(resp)
-    
+    @staticmethod
+    def _cache_key(prompt: str) -> str:
+        return hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        entry = self._llm_cache.get(key)
+        if entry is None:
+            return None
+        ts, text = entry
+        if time.time() - ts > LLM_CACHE_TTL:
+            self._llm_cache.pop(key, None)
+            return None
+        self._llm_cache.move_to_end(key)
+        return text
+
+    def _cache_put(self, key: str, text: str):
+        # Don't cache error replies, they should be retried
+        if text.startswith("LLM Error:"):
+            return
+        self._llm_cache[key] = (time.time(), text)
+        self._llm_cache.move_to_end(key)
+        while len(self._llm_cache) > LLM_CACHE_SIZE:
+            self._llm_cache.popitem(last=False)
+
     # ---------------------------
     # Gemini API Call
     # ---------------------------
     def _call_gemini(self, prompt: str, max_output_tokens: int = 500) -> str:
-        if not (USE_GEMINI and API_KEY):
+        if self._genai_client is None:
             return "LLM not configured. Set GOOGLE_API_KEY in .env to enable Gemini."
-        
+
+        key = self._cache_key(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
         try:
-            client = genai.Client()
-            resp = client.models.generate_content(
+            resp = self._genai_client.models.generate_content(
                 model="gemini-2.0-flash",
                 contents=prompt,
                 config=types.GenerateContentConfig(
@@ -153,36 +184,79 @@ class EduAgent:
                     temperature=0.2
                 )
             )
-            return self._extract_text_from_response(resp)
+            text = response_text(resp)
+            self._cache_put(key, text)
+            return text
         except Exception as outer:
             logger.exception(f"Gemini API error: {outer}")
             return f"LLM Error: {outer}"
-    
+
+    async def _call_gemini_async(self, prompt: str, max_output_tokens: int = 500) -> str:
+        if self._genai_client is None:
+            return "LLM not configured. Set GOOGLE_API_KEY in .env to enable Gemini."
+
+        key = self._cache_key(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            resp = await self._genai_client.aio.models.generate_content(
+                model="gemini-2.0-flash",
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    max_output_tokens=max_output_tokens,
+                    temperature=0.2
+                )
+            )
+            text = response_text(resp)
+            self._cache_put(key, text)
+            return text
+        except Exception as outer:
+            logger.exception(f"Gemini API error: {outer}")
+            return f"LLM Error: {outer}"
+
+    async def _call_gemini_stream(self, prompt: str, max_output_tokens: int = 500):
+        """Yield the Gemini reply incrementally as text chunks."""
+        if self._genai_client is None:
+            yield "LLM not configured. Set GOOGLE_API_KEY in .env to enable Gemini."
+            return
+
+        key = self._cache_key(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        try:
+            stream = await self._genai_client.aio.models.generate_content_stream(
+                model="gemini-2.0-flash",
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    max_output_tokens=max_output_tokens,
+                    temperature=0.2
+                )
+            )
+            parts = []
+            async for chunk in stream:
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+            self._cache_put(key, "".join(parts))
+        except Exception as outer:
+            logger.exception(f"Gemini API error: {outer}")
+            yield f"LLM Error: {outer}"
+
     # ---------------------------
     # Build Prompt with Structure Formatting
     # ---------------------------
     def build_prompt(self, user_query: str, context: str, sources: List[Dict[str, str]]):
         src_text = "\n".join(
-            [f"- {s['title']}: {s['snippet']} (url: {s['link']})"
-             for s in sources]
+            f"- {s['title']}: {s['snippet']} (url: {s['link']})"
+            for s in sources
         ) if sources else "No sources available."
         
-        prompt = f"""
-You are **Study Genie**, an AI study assistant. Always reply in a clean structured format.
-
-### 📌 RULES FOR EVERY RESPONSE
-- If user greets → greet warmly + introduce yourself.
-- Use clean formatting:
-  - Headings (###)
-  - Bullet points
-  - Numbered steps
-  - Code blocks if needed
-  - Bold for key terms
-- Give clear explanations suitable for students.
-- Include examples whenever possible.
-- End with a **2-line summary**.
-- List **up to 3 helpful sources** at the end (if available).
-
+        prompt = f"""{_SYSTEM_PROMPT_HEAD}
 ### 📘 CONTEXT (Recent conversation)
 {context if context else "No previous context."}
 
@@ -192,61 +266,167 @@ You are **Study Genie**, an AI study assistant. Always reply in a clean structur
 ### ❓ USER QUESTION
 {user_query}
 
-### 👉 NOW RESPOND FOLLOWING ALL RULES ABOVE
-"""
+{_SYSTEM_PROMPT_TAIL}"""
         return prompt
     
     # ---------------------------
     # Main Answer Function
     # ---------------------------
+    def _quiz_mode_response(self, quiz_params: Dict[str, Any], trace_id: str, start: float) -> AgentResponse:
+        logger.info(f"[{trace_id}] Quiz detected: {quiz_params}")
+        reply_text = f"""
+🎯 **Quiz Mode Activated!**
+
+I'll generate a test on **{quiz_params['topic']}** for Class {quiz_params['class_level']}
+with {quiz_params['num_questions']} questions.
+
+Click the "Start Quiz" button below to begin!
+"""
+        return AgentResponse(
+            text=reply_text,
+            sources=[],
+            metadata={
+                "trace_id": trace_id,
+                "elapsed_s": time.time() - start,
+                "time": datetime.now().isoformat()
+            },
+            is_quiz_request=True,
+            quiz_params=quiz_params
+        )
+
     def answer(self, session_id: str, user_query: str) -> AgentResponse:
         trace_id = str(uuid.uuid4())
         logger.info("[%s] Query: %s", trace_id, user_query)
         start = time.time()
-        
+
+        # Lowercase once; quiz detection and greeting check share it
+        text_lower = user_query.strip().lower()
+
         # Check if this is a quiz request
-        quiz_params = self.detect_quiz_request(user_query)
-        
-        if quiz_params:
-            logger.info(f"[{trace_id}] Quiz detected: {quiz_params}")
-            response_text = f"""
-🎯 **Quiz Mode Activated!**
+        quiz_params = self.detect_quiz_request(user_query, text_lower)
 
-I'll generate a test on **{quiz_params['topic']}** for Class {quiz_params['class_level']} 
-with {quiz_params['num_questions']} questions.
+        if quiz_params:
+            return self._quiz_mode_response(quiz_params, trace_id, start)
 
-Click the "Start Quiz" button below to begin!
-"""
-            return AgentResponse(
-                text=response_text,
-                sources=[],
-                metadata={
-                    "trace_id": trace_id,
-                    "elapsed_s": time.time() - start,
-                    "time": datetime.now().isoformat()
-                },
-                is_quiz_request=True,
-                quiz_params=quiz_params
-            )
-        
         # Normal conversation flow
-        processed_query = self.preprocess_user_input(user_query)
+        processed_query = self.preprocess_user_input(user_query, text_lower)
         context = self.memory.get_recent_context(session_id, n=5)
-        
+
         # Only search if not a greeting
         sources = []
         if processed_query == user_query:  # Not a greeting
             sources = self.search_tool.search(user_query, top_k=3)
-        
+
         prompt = self.build_prompt(processed_query, context, sources)
         text = self._call_gemini(prompt)
-        
+
         # Save memory
         self.memory.add_interaction(session_id, user_query, text, sources)
-        
+
         elapsed = time.time() - start
         logger.info("[%s] Completed in %.2fs", trace_id, elapsed)
-        
+
+        return AgentResponse(
+            text=text,
+            sources=sources,
+            metadata={
+                "trace_id": trace_id,
+                "elapsed_s": elapsed,
+                "time": datetime.now().isoformat()
+            }
+        )
+
+    async def answer_stream(self, session_id: str, user_query: str):
+        """Streaming variant of answer_async().
+
+        Yields {"delta": chunk} events as Gemini produces text, then a final
+        {"done": True, ...} event. Memory is written once at stream end.
+        """
+        trace_id = str(uuid.uuid4())
+        logger.info("[%s] Query (stream): %s", trace_id, user_query)
+        start = time.time()
+
+        # Lowercase once; quiz detection and greeting check share it
+        text_lower = user_query.strip().lower()
+
+        quiz_params = self.detect_quiz_request(user_query, text_lower)
+
+        if quiz_params:
+            resp = self._quiz_mode_response(quiz_params, trace_id, start)
+            yield {"delta": resp.text}
+            yield {
+                "done": True,
+                "sources": [],
+                "metadata": resp.metadata,
+                "is_quiz": True,
+                "quiz_params": quiz_params
+            }
+            return
+
+        processed_query = self.preprocess_user_input(user_query, text_lower)
+        context = self.memory.get_recent_context(session_id, n=5)
+
+        # Only search if not a greeting
+        sources = []
+        if processed_query == user_query:  # Not a greeting
+            sources = await self.search_tool.search_async(user_query, top_k=3)
+
+        prompt = self.build_prompt(processed_query, context, sources)
+
+        parts = []
+        async for chunk in self._call_gemini_stream(prompt):
+            parts.append(chunk)
+            yield {"delta": chunk}
+        text = "".join(parts)
+
+        # Save memory (file-backed, so keep it off the loop)
+        await asyncio.to_thread(self.memory.add_interaction, session_id, user_query, text, sources)
+
+        elapsed = time.time() - start
+        logger.info("[%s] Completed in %.2fs", trace_id, elapsed)
+
+        yield {
+            "done": True,
+            "sources": sources,
+            "metadata": {
+                "trace_id": trace_id,
+                "elapsed_s": elapsed,
+                "time": datetime.now().isoformat()
+            },
+            "is_quiz": False
+        }
+
+    async def answer_async(self, session_id: str, user_query: str) -> AgentResponse:
+        """Async variant of answer(); search and Gemini I/O run on the event loop."""
+        trace_id = str(uuid.uuid4())
+        logger.info("[%s] Query: %s", trace_id, user_query)
+        start = time.time()
+
+        # Lowercase once; quiz detection and greeting check share it
+        text_lower = user_query.strip().lower()
+
+        quiz_params = self.detect_quiz_request(user_query, text_lower)
+
+        if quiz_params:
+            return self._quiz_mode_response(quiz_params, trace_id, start)
+
+        processed_query = self.preprocess_user_input(user_query, text_lower)
+        context = self.memory.get_recent_context(session_id, n=5)
+
+        # Only search if not a greeting
+        sources = []
+        if processed_query == user_query:  # Not a greeting
+            sources = await self.search_tool.search_async(user_query, top_k=3)
+
+        prompt = self.build_prompt(processed_query, context, sources)
+        text = await self._call_gemini_async(prompt)
+
+        # Save memory (file-backed, so keep it off the loop)
+        await asyncio.to_thread(self.memory.add_interaction, session_id, user_query, text, sources)
+
+        elapsed = time.time() - start
+        logger.info("[%s] Completed in %.2fs", trace_id, elapsed)
+
         return AgentResponse(
             text=text,
             sources=sources,
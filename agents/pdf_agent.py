@@ -1,17 +1,41 @@
 # agents/pdf_agent.py
 import os
+import shutil
 import logging
-import PyPDF2
+import tempfile
+import pypdfium2 as pdfium
 import google.genai as genai
 from google.genai import types
 from typing import Dict, Any
-from io import BytesIO
+from functools import partial
+from agents._gemini_utils import response_text
+from concurrent.futures import ProcessPoolExecutor
 
 logger = logging.getLogger("pdf_agent")
 logger.setLevel(logging.INFO)
 
 API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Minimum number of pages before per-page extraction is worth farming out
+# to worker processes
+PARALLEL_PAGE_MIN = 4
+
+
+def _extract_page(pdf_path: str, page_idx: int) -> str:
+    """Extract one page's text; module-level so it can be pickled to workers.
+
+    Takes a filesystem path so each task ships a short string and pdfium
+    opens the document lazily, instead of unpickling the whole file per page.
+    """
+    pdf = pdfium.PdfDocument(pdf_path)
+    page = pdf[page_idx]
+    textpage = page.get_textpage()
+    text = textpage.get_text_range()
+    textpage.close()
+    page.close()
+    pdf.close()
+    return text
+
 
 class PDFAgent:
     """Extracts and summarizes PDF documents"""
@@ -23,26 +47,67 @@ class PDFAgent:
         self.client = genai.Client(api_key=self.api_key) if self.api_key else None
         self.max_chars = 15000  # Limit to avoid token overflow
     
-    def extract_text_from_pdf(self, pdf_bytes: bytes) -> str:
-        """Extract text from PDF bytes"""
+    def extract_text_from_pdf(self, pdf_source) -> str:
+        """Extract text from PDF bytes or a seekable file object"""
         try:
-            pdf_file = BytesIO(pdf_bytes)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text = ""
-            num_pages = len(pdf_reader.pages)
-            
-            # Extract text from all pages (limit to first 20 pages for free tier)
-            for page_num in range(min(num_pages, 20)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n\n"
-            
+            pdf = pdfium.PdfDocument(pdf_source)
+            num_pages = len(pdf)
+            # Limit to first 20 pages for free tier
+            pages_to_read = min(num_pages, 20)
+
+            if pages_to_read >= PARALLEL_PAGE_MIN:
+                # Page parsing is CPU-bound and independent per page: farm the
+                # indices out to worker processes and reassemble in order.
+                # Workers get a filesystem path, so the document is never
+                # buffered in RAM or serialized to the pool — uploads already
+                # sit in a named temp file and expose it via .name; bytes and
+                # anonymous buffers are spilled to one here.
+                pdf.close()
+                path = getattr(pdf_source, "name", None)
+                tmp_path = None
+                if not isinstance(path, str):
+                    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                        if isinstance(pdf_source, bytes):
+                            tmp.write(pdf_source)
+                        else:
+                            pdf_source.seek(0)
+                            shutil.copyfileobj(pdf_source, tmp)
+                        tmp_path = tmp.name
+                    path = tmp_path
+                try:
+                    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+                        pages = list(ex.map(
+                            partial(_extract_page, path),
+                            range(pages_to_read)
+                        ))
+                finally:
+                    if tmp_path:
+                        os.unlink(tmp_path)
+                text = "\n\n".join(pages)
+            else:
+                # Extract serially from the open document, stopping as soon as
+                # we have enough text — later pages would only be truncated away
+                text_parts = []
+                running_len = 0
+                for page_num in range(pages_to_read):
+                    page = pdf[page_num]
+                    textpage = page.get_textpage()
+                    page_text = textpage.get_text_range() + "\n\n"
+                    textpage.close()
+                    page.close()
+                    text_parts.append(page_text)
+                    running_len += len(page_text)
+                    if running_len >= self.max_chars:
+                        break
+                pdf.close()
+                text = "".join(text_parts)
+
             logger.info(f"Extracted {len(text)} characters from {num_pages} pages")
-            
+
             # Truncate if too long
             if len(text) > self.max_chars:
                 text = text[:self.max_chars] + "\n\n[Document truncated for processing...]"
-            
+
             return text
             
         except Exception as e:
@@ -122,7 +187,7 @@ Document text:
                 )
             )
             
-            summary = self._extract_text(response)
+            summary = response_text(response)
             
             return {
                 "success": True,
@@ -138,41 +203,32 @@ Document text:
                 "error": f"Summarization failed: {str(e)}"
             }
     
-    def _extract_text(self, response) -> str:
-        """Extract text from Gemini response"""
-        try:
-            if hasattr(response, "text") and response.text:
-                return response.text
-        except:
-            pass
-        
-        try:
-            candidates = getattr(response, "candidates", None)
-            if candidates:
-                content = getattr(candidates[0], "content", None)
-                if content:
-                    parts = getattr(content, "parts", [])
-                    for part in parts:
-                        if hasattr(part, "text"):
-                            return part.text
-        except:
-            pass
-        
-        return str(response)
-    
     def process_pdf(self, pdf_bytes: bytes, summary_type: str = "general") -> Dict[str, Any]:
         """Main method to process PDF: extract text and summarize"""
-        
+
         # Extract text
         text = self.extract_text_from_pdf(pdf_bytes)
-        
+
         if not text:
             return {
                 "success": False,
                 "error": "Could not extract text from PDF"
             }
-        
+
         # Summarize
         result = self.summarize_text(text, summary_type)
-        
-        return result
\ No newline at end of file
+
+        return result
+
+    def process_pdf_stream(self, file_obj, summary_type: str = "general") -> Dict[str, Any]:
+        """Process a PDF from an open file object without buffering it in RAM"""
+        file_obj.seek(0)
+        text = self.extract_text_from_pdf(file_obj)
+
+        if not text:
+            return {
+                "success": False,
+                "error": "Could not extract text from PDF"
+            }
+
+        return self.summarize_text(text, summary_type)
\ No newline at end of file
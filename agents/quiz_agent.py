@@ -1,19 +1,41 @@
 # agents/quiz_agent.py
 import os
-import json
+import re
+import time
+import random
+import asyncio
 import logging
+import orjson
 import google.genai as genai
 from google.genai import types
 from typing import List, Dict, Any
 from dataclasses import dataclass
+from agents._gemini_utils import response_text
 
 logger = logging.getLogger("quiz_agent")
 logger.setLevel(logging.INFO)
 
 API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Cache generated question pools so repeat (topic, class) quizzes skip Gemini
+QUIZ_CACHE_TTL = float(os.getenv("QUIZ_CACHE_TTL", "3600"))  # seconds
+QUIZ_POOL_SIZE = 10  # generate a pool once, sample repeats from it for variety
 
-@dataclass
+# Quiz generations arriving within this window are fused into one Gemini call
+QUIZ_BATCH_WINDOW = 0.075  # seconds
+
+# gemini-2.0-flash caps output at 8192 tokens and one quiz pool needs ~3000,
+# so at most two quizzes fit in a single reply; larger batches are chunked
+# into parallel calls
+QUIZ_TOKENS_PER_JOB = 3000
+QUIZ_BATCH_MAX_JOBS = 2
+
+# Matches a reply wrapped in a markdown code fence (``` or ```json, any case)
+# and captures the JSON body inside
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL | re.IGNORECASE)
+
+
+@dataclass(slots=True)
 class QuizQuestion:
     question: str
     options: List[str]
@@ -29,21 +51,52 @@ class QuizAgent:
         if not self.api_key:
             logger.error("GOOGLE_API_KEY not found in environment variables")
         self.client = genai.Client(api_key=self.api_key) if self.api_key else None
-    
+        # (topic, class_level) -> (timestamp, question pool)
+        self._quiz_cache: Dict[tuple, tuple] = {}
+        # (topic, class_level) -> future resolving to a question pool; concurrent
+        # requests for the same params share one future, and all pending keys
+        # are fused into a single batched Gemini call per window
+        self._pending: Dict[tuple, asyncio.Future] = {}
+        self._pending_sizes: Dict[tuple, int] = {}
+        # Strong references so in-flight batch tasks aren't garbage collected
+        self._batch_tasks: set = set()
+
     def generate_quiz(
-        self, 
-        topic: str, 
-        class_level: str = "11", 
+        self,
+        topic: str,
+        class_level: str = "11",
         num_questions: int = 5
     ) -> List[QuizQuestion]:
-        """Generate MCQ quiz dynamically using Gemini AI"""
-        
+        """Generate MCQ quiz as QuizQuestion objects"""
+        return [QuizQuestion(**q) for q in self.generate_quiz_dicts(topic, class_level, num_questions)]
+
+    def generate_quiz_dicts(
+        self,
+        topic: str,
+        class_level: str = "11",
+        num_questions: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Generate MCQ quiz dynamically using Gemini AI.
+
+        Returns validated question dicts directly (the API layer stores and
+        serves dicts, so no dataclass round-trip on the hot path).
+        """
+
+        cache_key = (topic.strip().lower(), str(class_level))
+        hit = self._cached_pool(cache_key, num_questions)
+        if hit is not None:
+            logger.info(f"Quiz cache hit for topic: {topic}")
+            return hit
+
         if not self.client:
             logger.error("Quiz client not initialized - API key missing")
             return self._fallback_questions(topic)
-        
+
+        # Generate a larger pool once so later requests can be served from cache
+        pool_size = max(num_questions, QUIZ_POOL_SIZE)
+
         prompt = f"""
-You are an expert educational quiz generator. Create {num_questions} multiple-choice questions (MCQs) 
+You are an expert educational quiz generator. Create {pool_size} multiple-choice questions (MCQs)
 specifically about "{topic}" suitable for Class {class_level} students.
 
 CRITICAL REQUIREMENTS:
@@ -68,7 +121,7 @@ Format:
   ]
 }}
 
-Generate {num_questions} questions now focused ONLY on: {topic}
+Generate {pool_size} questions now focused ONLY on: {topic}
 """
         
         try:
@@ -82,84 +135,228 @@ Generate {num_questions} questions now focused ONLY on: {topic}
             )
             
             # Extract text from response
-            text = self._extract_text(response)
+            text = response_text(response)
             
-            # Clean the response - remove markdown code blocks if present
-            text = text.strip()
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.startswith("```"):
-                text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-            text = text.strip()
+            # Clean the response - remove markdown code fence if present
+            m = _FENCE_RE.match(text)
+            text = m.group(1) if m else text.strip()
             
             # Parse JSON
-            data = json.loads(text)
-            questions = []
-            
-            for q in data.get("questions", []):
-                # Validate the question has all required fields
-                if all(key in q for key in ["question", "options", "correct_answer", "explanation"]):
-                    if len(q["options"]) == 4:  # Ensure exactly 4 options
-                        questions.append(QuizQuestion(
-                            question=q["question"],
-                            options=q["options"],
-                            correct_answer=q["correct_answer"],
-                            explanation=q["explanation"]
-                        ))
-            
+            data = orjson.loads(text)
+            questions = self._validate_questions(data.get("questions", []))
+
             if len(questions) >= 3:  # At least 3 valid questions
                 logger.info(f"Generated {len(questions)} questions for topic: {topic}")
-                return questions[:num_questions]
+                self._quiz_cache[cache_key] = (time.time(), questions)
+                if len(questions) > num_questions:
+                    return random.sample(questions, num_questions)
+                return questions
             else:
                 logger.warning(f"Only {len(questions)} valid questions generated, using fallback")
                 return self._fallback_questions(topic)
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"JSON parsing error: {e}")
             logger.error(f"Response text: {text[:500] if 'text' in locals() else 'No response'}")
             return self._fallback_questions(topic)
         except Exception as e:
             logger.exception(f"Quiz generation failed: {e}")
             return self._fallback_questions(topic)
-    
-    def _extract_text(self, response) -> str:
-        """Extract text from Gemini response"""
-        try:
-            if hasattr(response, "text") and response.text:
-                return response.text
-        except:
-            pass
-        
+
+    def _cached_pool(self, cache_key: tuple, num_questions: int):
+        """Sample from a fresh cached pool, or None on miss/expiry"""
+        cached = self._quiz_cache.get(cache_key)
+        if not cached:
+            return None
+        ts, pool = cached
+        if time.time() - ts <= QUIZ_CACHE_TTL and len(pool) >= num_questions:
+            # Random subset keeps repeat quizzes fresh without an API call
+            return random.sample(pool, num_questions)
+        self._quiz_cache.pop(cache_key, None)
+        return None
+
+    def _validate_questions(self, raw_questions) -> List[Dict[str, Any]]:
+        """Keep only well-formed questions with exactly 4 options"""
+        questions = []
+        for q in raw_questions:
+            if all(key in q for key in ["question", "options", "correct_answer", "explanation"]):
+                if len(q["options"]) == 4:
+                    questions.append({
+                        "question": q["question"],
+                        "options": q["options"],
+                        "correct_answer": q["correct_answer"],
+                        "explanation": q["explanation"]
+                    })
+        return questions
+
+    async def generate_quiz_dicts_async(
+        self,
+        topic: str,
+        class_level: str = "11",
+        num_questions: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Async quiz generation with request coalescing.
+
+        Requests landing within QUIZ_BATCH_WINDOW are grouped into a single
+        Gemini call, and concurrent requests for the same (topic, class)
+        share one pending result.
+        """
+        cache_key = (topic.strip().lower(), str(class_level))
+        hit = self._cached_pool(cache_key, num_questions)
+        if hit is not None:
+            logger.info(f"Quiz cache hit for topic: {topic}")
+            return hit
+
+        if not self.client:
+            logger.error("Quiz client not initialized - API key missing")
+            return self._fallback_questions(topic)
+
+        fut = self._pending.get(cache_key)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._pending[cache_key] = fut
+            self._pending_sizes[cache_key] = max(num_questions, QUIZ_POOL_SIZE)
+            if len(self._pending) == 1:
+                # First job in this generation of the pending dict: schedule
+                # the batch task that will own it. One task per generation —
+                # gating on a previous task being done would strand jobs that
+                # arrive while that batch's model call is still in flight.
+                task = asyncio.create_task(
+                    self._run_batch(self._pending, self._pending_sizes)
+                )
+                self._batch_tasks.add(task)
+                task.add_done_callback(self._batch_tasks.discard)
+        else:
+            self._pending_sizes[cache_key] = max(
+                self._pending_sizes[cache_key], num_questions
+            )
+
+        pool = await fut
+        if len(pool) > num_questions:
+            return random.sample(pool, num_questions)
+        return pool
+
+    async def _run_batch(self, jobs: Dict[tuple, asyncio.Future], sizes: Dict[tuple, int]):
+        """Serve one generation of pending quiz jobs after the batch window"""
+        await asyncio.sleep(QUIZ_BATCH_WINDOW)
+        # Detach the generation we own; jobs arriving from here on go into a
+        # fresh dict with a batch task of its own
+        if self._pending is jobs:
+            self._pending = {}
+            self._pending_sizes = {}
+        if not jobs:
+            return
+
+        # Chunk so each call's reply fits the model's output-token cap, and
+        # run the chunks concurrently
+        keys = list(jobs)
+        chunks = [
+            keys[i:i + QUIZ_BATCH_MAX_JOBS]
+            for i in range(0, len(keys), QUIZ_BATCH_MAX_JOBS)
+        ]
+        results = await asyncio.gather(
+            *(self._generate_batch(chunk, sizes) for chunk in chunks)
+        )
+        pools = {}
+        for chunk_pools in results:
+            pools.update(chunk_pools)
+        logger.info(f"Batch generated {len(pools)}/{len(keys)} quizzes in {len(chunks)} call(s)")
+
+        for key, fut in jobs.items():
+            pool = pools.get(key)
+            if pool:
+                self._quiz_cache[key] = (time.time(), pool)
+            else:
+                pool = self._fallback_questions(key[0])
+            if not fut.done():
+                fut.set_result(pool)
+
+    async def _generate_batch(self, keys: List[tuple], sizes: Dict[tuple, int]) -> Dict[tuple, list]:
+        """Generate quizzes for up to QUIZ_BATCH_MAX_JOBS jobs in one call"""
+        specs = [
+            {
+                "id": i,
+                "topic": key[0],
+                "class_level": key[1],
+                "num_questions": sizes[key]
+            }
+            for i, key in enumerate(keys)
+        ]
+
+        prompt = f"""
+You are an expert educational quiz generator. Generate one MCQ quiz for EACH
+of the following requests:
+
+{orjson.dumps(specs).decode()}
+
+CRITICAL REQUIREMENTS (for every quiz):
+1. Questions MUST be directly related to that request's topic only
+2. Each question must have exactly 4 options (A, B, C, D)
+3. Questions should be appropriate for the requested class level
+4. Include a mix of difficulty: easy, medium, hard
+5. Provide clear, educational explanations for correct answers
+6. Generate the requested number of questions per quiz
+
+IMPORTANT: Return ONLY a valid JSON object (no markdown, no code blocks, no extra text).
+
+Format:
+{{
+  "quizzes": [
+    {{
+      "id": 0,
+      "questions": [
+        {{
+          "question": "Question text?",
+          "options": ["Option A text", "Option B text", "Option C text", "Option D text"],
+          "correct_answer": 0,
+          "explanation": "Why this answer is correct."
+        }}
+      ]
+    }}
+  ]
+}}
+"""
+
+        pools = {}
         try:
-            candidates = getattr(response, "candidates", None)
-            if candidates:
-                content = getattr(candidates[0], "content", None)
-                if content:
-                    parts = getattr(content, "parts", [])
-                    for part in parts:
-                        if hasattr(part, "text"):
-                            return part.text
-        except:
-            pass
-        
-        return str(response)
-    
-    def _fallback_questions(self, topic: str) -> List[QuizQuestion]:
+            response = await self.client.aio.models.generate_content(
+                model="gemini-2.0-flash",
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    max_output_tokens=QUIZ_TOKENS_PER_JOB * len(keys),
+                    temperature=0.8
+                )
+            )
+            text = response_text(response)
+            m = _FENCE_RE.match(text)
+            text = m.group(1) if m else text.strip()
+
+            data = orjson.loads(text)
+            for quiz in data.get("quizzes", []):
+                idx = quiz.get("id")
+                if isinstance(idx, int) and 0 <= idx < len(keys):
+                    questions = self._validate_questions(quiz.get("questions", []))
+                    if len(questions) >= 3:
+                        pools[keys[idx]] = questions
+        except Exception as e:
+            logger.exception(f"Batched quiz generation failed: {e}")
+
+        return pools
+
+    def _fallback_questions(self, topic: str) -> List[Dict[str, Any]]:
         """Fallback questions if AI generation fails"""
         return [
-            QuizQuestion(
-                question=f"This is a sample question about {topic}. The quiz generator encountered an error.",
-                options=[
+            {
+                "question": f"This is a sample question about {topic}. The quiz generator encountered an error.",
+                "options": [
                     "Please try again",
                     "Check your API key",
                     "Restart the server",
                     "Contact support"
                 ],
-                correct_answer=0,
-                explanation=f"The AI failed to generate questions about {topic}. Please try again or check your API configuration."
-            )
+                "correct_answer": 0,
+                "explanation": f"The AI failed to generate questions about {topic}. Please try again or check your API configuration."
+            }
         ]
     
     def evaluate_answer(self, question: QuizQuestion, user_answer: int) -> Dict[str, Any]:
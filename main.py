@@ -1,10 +1,13 @@
 # main.py
 import os
 import uuid
+import asyncio
 import logging
+import tempfile
+import orjson
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, UploadFile, File
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from prometheus_client import Counter, generate_latest, CONTENT_TYPE_LATEST
@@ -18,21 +21,60 @@ from agents.pdf_agent import PDFAgent
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("edu_agent_app")
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="template")
 
-MEMORY_FILE = os.getenv("MEMORY_FILE", "memory_bank.json")
+MEMORY_FILE = os.getenv("MEMORY_FILE", "memory_bank.db")
 agent = EduAgent(memory_file=MEMORY_FILE)
 quiz_agent = QuizAgent()
 pdf_agent = PDFAgent()
 
 REQUESTS = Counter("edu_agent_requests_total", "Total bot requests")
 
-# In-memory quiz storage (use Redis in production)
+# Quiz state lives in Redis (shared across workers, expires automatically).
+# Falls back to an in-process dict when REDIS_URL is not configured, which
+# only works with a single uvicorn worker.
+REDIS_URL = os.getenv("REDIS_URL")
+QUIZ_TTL_SECONDS = int(os.getenv("QUIZ_TTL_SECONDS", "3600"))
+
+redis_client = None
+if REDIS_URL:
+    import redis.asyncio as redis
+    redis_client = redis.from_url(REDIS_URL)
+
 active_quizzes = {}
 
 
+async def load_quiz(quiz_id: str):
+    if redis_client is not None:
+        raw = await redis_client.get(f"quiz:{quiz_id}")
+        return orjson.loads(raw) if raw else None
+    return active_quizzes.get(quiz_id)
+
+
+async def save_quiz(quiz_id: str, state: dict):
+    if redis_client is not None:
+        await redis_client.set(f"quiz:{quiz_id}", orjson.dumps(state), ex=QUIZ_TTL_SECONDS)
+    else:
+        active_quizzes[quiz_id] = state
+
+
+async def delete_quiz(quiz_id: str):
+    if redis_client is not None:
+        await redis_client.delete(f"quiz:{quiz_id}")
+    else:
+        active_quizzes.pop(quiz_id, None)
+
+
+@app.on_event("shutdown")
+async def flush_memory():
+    # Persist any buffered interactions and release the search HTTP session
+    # before the worker exits
+    await asyncio.to_thread(agent.memory.flush)
+    await agent.search_tool.aclose()
+
+
 @app.middleware("http")
 async def add_request_id(request: Request, call_next):
     request_id = str(uuid.uuid4())
@@ -56,7 +98,7 @@ async def chat_api(request: Request):
     
     logger.info("Chat request session=%s text=%s", session_id, user_text)
     
-    resp = agent.answer(session_id=session_id, user_query=user_text)
+    resp = await agent.answer_async(session_id=session_id, user_query=user_text)
     
     response_data = {
         "reply": resp.text,
@@ -69,7 +111,26 @@ async def chat_api(request: Request):
     if resp.is_quiz_request:
         response_data["quiz_params"] = resp.quiz_params
     
-    return JSONResponse(response_data)
+    return ORJSONResponse(response_data)
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: Request):
+    """Stream the reply as Server-Sent Events instead of buffering it"""
+    REQUESTS.inc()
+    payload = await request.json()
+    session_id = payload.get("session_id") or str(uuid.uuid4())
+    user_text = payload.get("text", "")
+
+    logger.info("Chat stream request session=%s text=%s", session_id, user_text)
+
+    async def event_generator():
+        async for event in agent.answer_stream(session_id=session_id, user_query=user_text):
+            if event.get("done"):
+                event["session_id"] = session_id
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
 @app.post("/api/quiz/generate")
@@ -84,45 +145,41 @@ async def generate_quiz(request: Request):
     logger.info(f"Generating quiz: topic={topic}, class={class_level}, questions={num_questions}")
     
     try:
-        questions = quiz_agent.generate_quiz(topic, class_level, num_questions)
-        
+        # Question dicts go straight into quiz state, no dataclass round-trip;
+        # concurrent generations within a short window share one Gemini call
+        questions = await quiz_agent.generate_quiz_dicts_async(
+            topic, class_level, num_questions
+        )
+
         # Create quiz ID
         quiz_id = str(uuid.uuid4())
-        
-        # Store quiz in memory
-        active_quizzes[quiz_id] = {
+
+        # Store quiz state
+        await save_quiz(quiz_id, {
             "session_id": session_id,
             "topic": topic,
             "class_level": class_level,
-            "questions": [
-                {
-                    "question": q.question,
-                    "options": q.options,
-                    "correct_answer": q.correct_answer,
-                    "explanation": q.explanation
-                }
-                for q in questions
-            ],
+            "questions": questions,
             "current_index": 0,
             "score": 0,
             "answers": []
-        }
-        
+        })
+
         # Return first question
         first_q = questions[0]
-        return JSONResponse({
+        return ORJSONResponse({
             "quiz_id": quiz_id,
             "total_questions": len(questions),
             "current_question": 1,
             "question": {
-                "text": first_q.question,
-                "options": first_q.options
+                "text": first_q["question"],
+                "options": first_q["options"]
             }
         })
     
     except Exception as e:
         logger.exception(f"Quiz generation failed: {e}")
-        return JSONResponse({
+        return ORJSONResponse({
             "error": "Failed to generate quiz. Please try again."
         }, status_code=500)
 
@@ -134,10 +191,10 @@ async def submit_answer(request: Request):
     quiz_id = payload.get("quiz_id")
     user_answer = payload.get("answer")
     
-    if quiz_id not in active_quizzes:
-        return JSONResponse({"error": "Quiz not found"}, status_code=404)
-    
-    quiz = active_quizzes[quiz_id]
+    quiz = await load_quiz(quiz_id)
+    if quiz is None:
+        return ORJSONResponse({"error": "Quiz not found"}, status_code=404)
+
     current_idx = quiz["current_index"]
     current_q = quiz["questions"][current_idx]
     
@@ -162,8 +219,10 @@ async def submit_answer(request: Request):
     if next_idx >= len(quiz["questions"]):
         total = len(quiz["questions"])
         percentage = (quiz["score"] / total) * 100
-        
-        return JSONResponse({
+
+        await delete_quiz(quiz_id)
+
+        return ORJSONResponse({
             "completed": True,
             "score": quiz["score"],
             "total": total,
@@ -172,9 +231,11 @@ async def submit_answer(request: Request):
             "was_correct": is_correct
         })
     
+    await save_quiz(quiz_id, quiz)
+
     # Return next question
     next_q = quiz["questions"][next_idx]
-    return JSONResponse({
+    return ORJSONResponse({
         "completed": False,
         "current_question": next_idx + 1,
         "total_questions": len(quiz["questions"]),
@@ -190,7 +251,7 @@ async def submit_answer(request: Request):
 @app.get("/api/history/{session_id}")
 async def history(session_id: str):
     hist = agent.memory.get_history(session_id)
-    return JSONResponse({"history": hist})
+    return ORJSONResponse({"history": hist})
 
 
 @app.get("/metrics")
@@ -204,22 +265,27 @@ async def summarize_pdf(file: UploadFile = File(...)):
     """Upload and summarize a PDF file"""
     
     if not file.filename.endswith('.pdf'):
-        return JSONResponse({
+        return ORJSONResponse({
             "success": False,
             "error": "Only PDF files are supported"
         }, status_code=400)
     
     try:
-        # Read PDF bytes
-        pdf_bytes = await file.read()
-        
-        logger.info(f"Processing PDF: {file.filename} ({len(pdf_bytes)} bytes)")
-        
-        # Process PDF
-        result = pdf_agent.process_pdf(pdf_bytes, summary_type="general")
+        # Stream the upload to a named temp file in chunks instead of
+        # buffering the whole PDF in RAM; the parallel extraction path's
+        # workers reopen it by path
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+            while chunk := await file.read(1 << 20):
+                tmp.write(chunk)
+            tmp.flush()
+
+            logger.info(f"Processing PDF: {file.filename} ({tmp.tell()} bytes)")
+
+            # Process PDF
+            result = await asyncio.to_thread(pdf_agent.process_pdf_stream, tmp, "general")
         
         if result["success"]:
-            return JSONResponse({
+            return ORJSONResponse({
                 "success": True,
                 "filename": file.filename,
                 "summary": result["summary"],
@@ -227,14 +293,14 @@ async def summarize_pdf(file: UploadFile = File(...)):
                 "summary_length": result["summary_length"]
             })
         else:
-            return JSONResponse({
+            return ORJSONResponse({
                 "success": False,
                 "error": result.get("error", "Unknown error")
             }, status_code=500)
     
     except Exception as e:
         logger.exception(f"PDF processing error: {e}")
-        return JSONResponse({
+        return ORJSONResponse({
             "success": False,
             "error": str(e)
         }, status_code=500)
\ No newline at end of file
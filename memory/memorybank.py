@@ -1,51 +1,167 @@
 # memory/memorybank.py
-import json, os, threading
+import json, os, sqlite3, threading, time
 from datetime import datetime
 from typing import List, Dict, Any
 
-lock = threading.Lock()
+# Dirty entries are coalesced and written once per window instead of
+# committing inside every request
+FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "1.0"))  # seconds
+FLUSH_BATCH = 32  # flush immediately once this many writes are pending
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions(
+    session_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    time TEXT NOT NULL,
+    user TEXT,
+    bot TEXT,
+    sources TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_sess_ts ON interactions(session_id, ts DESC);
+"""
+
+_SQLITE_MAGIC = b"SQLite format 3\x00"
+
 
 class MemoryBank:
-    def __init__(self, filename: str = "memory_bank.json"):
-        self.filename = filename or "memory_bank.json"
-        if not os.path.exists(self.filename):
-            with open(self.filename, "w", encoding="utf-8") as f:
-                json.dump({}, f)
-        self._load()
-
-    def _load(self):
-        with open(self.filename, "r", encoding="utf-8") as f:
-            try:
-                self.store = json.load(f)
-            except Exception:
-                self.store = {}
-
-    def _save(self):
-        with lock:
-            with open(self.filename, "w", encoding="utf-8") as f:
-                json.dump(self.store, f, indent=2, ensure_ascii=False)
+    """Session history on SQLite; lookups are indexed by (session_id, ts)"""
+
+    def __init__(self, filename: str = "memory_bank.db"):
+        self.filename = filename or "memory_bank.db"
+        self._lock = threading.Lock()
+        legacy_store = self._read_legacy_store()
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        # WAL lets readers proceed while the flusher commits
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        if legacy_store is not None:
+            self._migrate_legacy(legacy_store)
+        self._pending: List[tuple] = []
+        self._dirty = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def _read_legacy_store(self):
+        """Detect a pre-SQLite JSON store at the configured path.
+
+        Returns the parsed store (moving the old file aside as .bak) so it can
+        be migrated, or None when the path is missing, empty or already SQLite.
+        """
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) == 0:
+            return None
+        with open(self.filename, "rb") as f:
+            if f.read(len(_SQLITE_MAGIC)) == _SQLITE_MAGIC:
+                return None
+        try:
+            with open(self.filename, "r", encoding="utf-8") as f:
+                store = json.load(f)
+        except Exception:
+            raise ValueError(
+                f"MEMORY_FILE {self.filename!r} is neither a SQLite database nor "
+                "a legacy JSON memory bank; remove it or point MEMORY_FILE elsewhere"
+            )
+        os.replace(self.filename, self.filename + ".bak")
+        return store if isinstance(store, dict) else {}
+
+    def _migrate_legacy(self, store: Dict[str, Any]):
+        """Import sessions from the old JSON store into the database"""
+        rows = []
+        for session_id, sess in store.items():
+            for it in sess.get("history", []):
+                iso = it.get("time") or datetime.now().isoformat()
+                try:
+                    ts = datetime.fromisoformat(iso).timestamp()
+                except ValueError:
+                    ts = time.time()
+                rows.append((
+                    session_id,
+                    ts,
+                    iso,
+                    it.get("user"),
+                    it.get("bot"),
+                    json.dumps(it.get("sources") or [], ensure_ascii=False)
+                ))
+        if rows:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT INTO interactions(session_id, ts, time, user, bot, sources) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.commit()
+
+    def _flush_loop(self):
+        while True:
+            self._dirty.wait()
+            # Give a short window for more writes to pile up, unless a batch
+            # is already waiting
+            if len(self._pending) < FLUSH_BATCH:
+                time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """Write pending interactions to the database (no-op when clean)"""
+        with self._lock:
+            if not self._pending:
+                self._dirty.clear()
+                return
+            rows = self._pending
+            self._pending = []
+            self._dirty.clear()
+            self._conn.executemany(
+                "INSERT INTO interactions(session_id, ts, time, user, bot, sources) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
 
     def add_interaction(self, session_id: str, user: str, bot: str, sources: List[Dict[str, str]] = None):
-        self._load()
-        sess = self.store.setdefault(session_id, {"history": []})
-        sess["history"].append({
-            "time": datetime.now().isoformat(),
-            "user": user,
-            "bot": bot,
-            "sources": sources or []
-        })
-        sess["history"] = sess["history"][-200:]
-        self._save()
+        row = (
+            session_id,
+            time.time(),
+            datetime.now().isoformat(),
+            user,
+            bot,
+            json.dumps(sources or [], ensure_ascii=False)
+        )
+        with self._lock:
+            self._pending.append(row)
+            self._dirty.set()
+
+    def _pending_for(self, session_id: str) -> List[Dict[str, Any]]:
+        """Buffered-but-unflushed interactions for a session, oldest first"""
+        return [
+            {"time": r[2], "user": r[3], "bot": r[4], "sources": json.loads(r[5])}
+            for r in self._pending
+            if r[0] == session_id
+        ]
 
     def get_recent_context(self, session_id: str, n: int = 5) -> str:
-        self._load()
-        sess = self.store.get(session_id, {})
-        hist = sess.get("history", [])[-n:]
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user, bot FROM interactions WHERE session_id=? "
+                "ORDER BY ts DESC LIMIT ?",
+                (session_id, n)
+            ).fetchall()
+            hist = [{"user": u, "bot": b} for u, b in reversed(rows)]
+            hist += self._pending_for(session_id)
         ctx = ""
-        for it in hist:
+        for it in hist[-n:]:
             ctx += f"USER: {it.get('user')}\nBOT: {it.get('bot')}\n"
         return ctx
 
     def get_history(self, session_id: str):
-        self._load()
-        return self.store.get(session_id, {}).get("history", [])
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT time, user, bot, sources FROM interactions "
+                "WHERE session_id=? ORDER BY ts",
+                (session_id,)
+            ).fetchall()
+            hist = [
+                {"time": t, "user": u, "bot": b, "sources": json.loads(s)}
+                for t, u, b, s in rows
+            ]
+            hist += self._pending_for(session_id)
+        return hist
@@ -1,5 +1,6 @@
 # tools/google_search.py
 import os, requests, logging
+import aiohttp
 logger = logging.getLogger("edu_agent.tools")
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -10,6 +11,41 @@ class GoogleSearchTool:
         self.api_key = api_key or GOOGLE_API_KEY
         self.cse_id = cse_id or GOOGLE_CSE_ID
         self.endpoint = "https://www.googleapis.com/customsearch/v1"
+        self._session = None  # lazily created aiohttp session, reused across requests
+
+    def _parse_items(self, data, top_k: int):
+        items = data.get("items", [])[:top_k]
+        results = []
+        for it in items:
+            results.append({
+                "title": it.get("title"),
+                "link": it.get("link"),
+                "snippet": it.get("snippet") or ""
+            })
+        return results
+
+    async def search_async(self, query: str, top_k: int = 3):
+        if not self.api_key or not self.cse_id:
+            logger.warning("GoogleSearchTool: missing API key or CSE ID")
+            return []
+        params = {"key": self.api_key, "cx": self.cse_id, "q": query, "num": top_k}
+        try:
+            if self._session is None or self._session.closed:
+                self._session = aiohttp.ClientSession(
+                    timeout=aiohttp.ClientTimeout(total=8)
+                )
+            async with self._session.get(self.endpoint, params=params) as r:
+                r.raise_for_status()
+                data = await r.json()
+            return self._parse_items(data, top_k)
+        except Exception as e:
+            logger.exception("GoogleSearchTool.search_async failed: %s", e)
+            return []
+
+    async def aclose(self):
+        """Close the aiohttp session (call on application shutdown)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
 
     def search(self, query: str, top_k: int = 3):
         if not self.api_key or not self.cse_id:
@@ -19,16 +55,7 @@ class GoogleSearchTool:
         try:
             r = requests.get(self.endpoint, params=params, timeout=8)
             r.raise_for_status()
-            data = r.json()
-            items = data.get("items", [])[:top_k]
-            results = []
-            for it in items:
-                results.append({
-                    "title": it.get("title"),
-                    "link": it.get("link"),
-                    "snippet": it.get("snippet") or ""
-                })
-            return results
+            return self._parse_items(r.json(), top_k)
         except Exception as e:
             logger.exception("GoogleSearchTool.search failed: %s", e)
             return []